@@ -1,13 +1,13 @@
 """Execute Mind the Gap with automated parameter selection"""
 
-import warnings
 import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
 from itertools import repeat
 
 import geopandas as gpd
 import pandas as pd
 import numpy as np
-from shapely import geometry
+import shapely
 
 import mind_the_gap.mind_the_gap as mtg
 from mind_the_gap.chainage import prepare_points
@@ -42,23 +42,61 @@ class Region:
 
         self.buildings = buildings
         self.boundary = boundary
+        self._bldg_geoms = np.asarray(self.buildings.geometry.values)
+        self._bldg_tree = shapely.STRtree(self._bldg_geoms)
         self.gaps = []
         self.grid = []
         self.in_gaps_ratio = 0
         self.area_ratio = 0
         self.all_points_gdf = None
+        self._empty_grid = None
+        self._empty_grid_tree = None
+        self._empty_grid_area = 0
+
+        # Equal area projection to measure open space in
+        self._area_crs = 'EPSG:6933'
 
         self.boundaries_shape = self.boundary
-        self.boundaries = ([self.boundary.boundary][0])[0]
+        self.boundaries = self.boundary.geometry.iloc[0].boundary
 
         # Generate chainage and combine with building points
         self.all_points_gdf = prepare_points(self.buildings,
                                              self.boundary,
                                              0.01)
+        self._all_pts_tree = shapely.STRtree(self.all_points_gdf.geometry)
+        self._all_pts_coords = mtg.get_coordinates(self.all_points_gdf)
 
         # Make grid
         self.make_grid(size=grid_size)
 
+    def __getstate__(self):
+        """Leaves out the trees and arrays that can be rebuilt.
+
+        Regions are pickled to workers in `run_parallel`, and the derived
+        caches would roughly double what gets sent.
+
+        """
+
+        state = self.__dict__.copy()
+        for name in ('_bldg_geoms',
+                     '_bldg_tree',
+                     '_all_pts_tree',
+                     '_all_pts_coords',
+                     '_empty_grid_tree'):
+            del state[name]
+
+        return state
+
+    def __setstate__(self, state):
+        """Rebuilds the trees and arrays left out by `__getstate__`"""
+
+        self.__dict__.update(state)
+        self._bldg_geoms = np.asarray(self.buildings.geometry.values)
+        self._bldg_tree = shapely.STRtree(self._bldg_geoms)
+        self._all_pts_tree = shapely.STRtree(self.all_points_gdf.geometry)
+        self._all_pts_coords = mtg.get_coordinates(self.all_points_gdf)
+        self._empty_grid_tree = shapely.STRtree(self._empty_grid.geometry)
+
     def make_grid(self, size=0.02):
         """Make grid to check gap completeness.
         
@@ -69,30 +107,29 @@ class Region:
             
         """
 
-        bounds = self.boundaries.bounds
-
-        min_x = bounds[0]
-        min_y = bounds[1]
-        max_x = bounds[2]
-        max_y = bounds[3]
-
-        cols = list(np.arange(min_x, max_x + size, size))
-        rows = list(np.arange(min_y, max_y + size, size))
-
-        polygons = []
-        for x in cols[:-1]:
-            for y in rows[:-1]:
-                polygons.append(geometry.Polygon([(x,y),
-                                                  (x + size, y),
-                                                  (x + size, y + size),
-                                                  (x, y + size)]))
-        grid = gpd.GeoDataFrame({'geometry':polygons},crs='EPSG:4326')
+        corners = _square_corners(self.boundaries.bounds, size)
 
         # Clip grid to region extent
-        grid = gpd.clip(grid, self.boundaries_shape)
+        cell_inds, cells = _clip_squares(corners, self.boundaries_shape)
+        grid = gpd.GeoDataFrame({'geometry':cells},
+                                index=cell_inds,
+                                crs='EPSG:4326')
 
         self.grid = grid
 
+        # Cells without any points only depend on the grid, so find them once
+        # here rather than on every fit_check
+        full_cells, _ = self._all_pts_tree.query(self.grid.geometry.values,
+                                                 predicate='contains')
+        is_empty = np.ones(len(self.grid), dtype=bool)
+        is_empty[full_cells] = False
+
+        # Areas are compared in an equal area projection, as degrees shrink
+        # away from the equator
+        self._empty_grid = self.grid.loc[is_empty].to_crs(self._area_crs)
+        self._empty_grid_tree = shapely.STRtree(self._empty_grid.geometry)
+        self._empty_grid_area = self._empty_grid.area.sum()
+
     def mind(self, w, ln_ratio, i, a):
         """Execute mind the gap
     
@@ -109,17 +146,8 @@ class Region:
         
         """
 
-        # Execute mind the gap
-        l = w * ln_ratio + (w / 4)
-
-        self.gaps = mtg.mind_the_gap(self.all_points_gdf,
-                                     w,
-                                     w,
-                                     l,
-                                     l,
-                                     i,
-                                     i,
-                                     alpha=a)
+        gaps = _mind_gaps(self._all_pts_coords, w, ln_ratio)
+        self.gaps = _mind_polygons(gaps, i, a)
 
     def fit_check(self, build_thresh, area_floor, area_ceiling):
         """Checks how well the gaps fit the data
@@ -146,36 +174,21 @@ class Region:
         elif len(self.gaps) < 1:
             return False
         else:
-            # Check proportion of buildings in the gaps
-            buildings_series = self.buildings.geometry
-            in_gaps = self.buildings.sjoin(self.gaps, how='inner')
-
-            self.in_gaps_ratio = in_gaps.size / buildings_series.size
-
-            # Get open space or grid cells
-            joined_grid = gpd.sjoin(self.grid,
-                                    self.all_points_gdf,
-                                    how='left',
-                                    predicate='contains')
-            empty_grid = joined_grid.loc[joined_grid['index_right'].isna()]
-
-            with warnings.catch_warnings():
-                warnings.filterwarnings("ignore",
-                                        message =
-                                        "Geometry is in a geographic CRS.")
-                empty_grid_area = sum(empty_grid['geometry'].area)
-
-            gaps_in_empty_grid = gpd.overlay(empty_grid,
-                                             self.gaps,
-                                             how='intersection',
-                                             keep_geom_type=True)
-            gaps_in_empty_grid = gaps_in_empty_grid.unary_union
-
-            if gaps_in_empty_grid is None:
-                return False
+            gap_geoms = np.asarray(self.gaps.geometry.values)
+
+            # Check proportion of buildings in the gaps. A building inside
+            # several overlapping gaps still only counts once.
+            _, building_inds = self._bldg_tree.query(gap_geoms,
+                                                     predicate='intersects')
+            in_gaps_count = np.unique(building_inds).size
+
+            self.in_gaps_ratio = in_gaps_count / max(1, len(self._bldg_geoms))
 
-            gaps_in_empty_grid_area = gaps_in_empty_grid.area
-            self.area_ratio = gaps_in_empty_grid_area / empty_grid_area
+            # Tiles packed with points have no open space for gaps to fill
+            if self._empty_grid_area == 0:
+                self.area_ratio = 0
+            else:
+                self.area_ratio = self._open_space_ratio()
 
             if (self.in_gaps_ratio < build_thresh) and \
                 ((self.area_ratio > area_floor) and \
@@ -184,6 +197,46 @@ class Region:
             else:
                 return False
 
+    def _open_space_ratio(self):
+        """Proportion of the open space in the grid covered by the gaps"""
+
+        # Open space grid cells are cached by make_grid, projected
+        cells = np.asarray(self._empty_grid.geometry.values)
+        gap_geoms = np.asarray(
+            self.gaps.geometry.to_crs(self._area_crs).values)
+
+        # Pair up empty cells with the gaps they touch
+        gap_inds, cell_inds = self._empty_grid_tree.query(
+            gap_geoms,
+            predicate='intersects')
+
+        if len(cell_inds) == 0:
+            return 0
+
+        # Cells wholly inside a gap are their own piece, so only cells on
+        # the edge of a gap need intersecting
+        shapely.prepare(gap_geoms)
+        pieces = cells[cell_inds]
+        on_edge = ~shapely.contains(gap_geoms[gap_inds], pieces)
+        pieces[on_edge] = shapely.intersection(pieces[on_edge],
+                                               gap_geoms[gap_inds[on_edge]])
+
+        # Cells never overlap, so areas can be summed cell by cell. Only
+        # cells touching more than one gap need their pieces dissolved in
+        # case those gaps overlap.
+        is_shared = np.bincount(cell_inds)[cell_inds] > 1
+        gaps_in_empty_grid_area = shapely.area(pieces[~is_shared]).sum()
+
+        # Group the shared cells' pieces with one sort, keeping query order
+        order = np.argsort(cell_inds[is_shared], kind='stable')
+        shared_inds = cell_inds[is_shared][order]
+        shared_pieces = pieces[is_shared][order]
+        _, starts = np.unique(shared_inds, return_index=True)
+        for cell_pieces in np.split(shared_pieces, starts[1:]):
+            gaps_in_empty_grid_area += shapely.union_all(cell_pieces).area
+
+        return gaps_in_empty_grid_area / self._empty_grid_area
+
     def run(self,
             build_thresh=0.07,
             area_floor=0.2,
@@ -192,7 +245,9 @@ class Region:
             _w_step=0.025,
             _ln_ratio=2,
             _is=(2,3,4),
-            _a=20,):
+            _a=20,
+            search='linear',
+            cpus=None):
         """Iterates through parameters until a good set is settled on"
         
         Parameters
@@ -213,17 +268,57 @@ class Region:
             1-d set of numbers of interesections to try
         _a : int
             Alpha value for alpha-shapes
+        search : {'linear', 'bisect'}
+            How to step through widths. 'linear' tries every width from `_w`
+            down, and settles on the widest one that fits. 'bisect' halves
+            the same set of widths using the area ratio, which takes far
+            fewer runs but may settle on a different width that fits.
+        cpus : int, optional
+            Number of processes to try the numbers of intersections for each
+            width at once. Runs serially by default, as it must inside
+            `run_parallel`'s workers.
 
         """
 
+        if search not in ('linear', 'bisect'):
+            raise ValueError("search must be 'linear' or 'bisect'")
+
+        if cpus is None or cpus < 2:
+            self._search(build_thresh, area_floor, area_ceiling, _w, _w_step,
+                         _ln_ratio, _is, _a, search)
+            return
+
+        with ProcessPoolExecutor(max_workers=cpus) as executor:
+            self._search(build_thresh, area_floor, area_ceiling, _w, _w_step,
+                         _ln_ratio, _is, _a, search, executor)
+
+    def _search(self,
+                build_thresh,
+                area_floor,
+                area_ceiling,
+                _w,
+                _w_step,
+                _ln_ratio,
+                _is,
+                _a,
+                search='linear',
+                executor=None):
+        """Searches widths the way `run` was asked to"""
+
+        if search == 'bisect' and self._bldg_geoms.size > 0:
+            self._run_bisect(build_thresh, area_floor, area_ceiling, _w,
+                             _w_step, _ln_ratio, _is, _a, executor)
+            return
+
         past_gaps = []
         past_params = []
 
         while True:
-            if self.buildings.geometry.size == 0:
+            if self._bldg_geoms.size == 0:
                 self.gaps = self.boundaries_shape
                 break
 
+            gaps = self._sweep(_w, _ln_ratio, _is, _a, executor)
             for i in _is:
                 these_params = [_w, _ln_ratio, i, _a]
 
@@ -233,7 +328,7 @@ class Region:
                                                   crs='EPSG:4326')
                     break
 
-                self.mind(_w, _ln_ratio, i, _a)
+                self.gaps = next(gaps)
 
                 fit = self.fit_check(build_thresh, area_floor, area_ceiling)
 
@@ -255,6 +350,86 @@ class Region:
             # Update paramaters
             _w = _w - _w_step
 
+    def _run_bisect(self,
+                    build_thresh,
+                    area_floor,
+                    area_ceiling,
+                    _w,
+                    _w_step,
+                    _ln_ratio,
+                    _is,
+                    _a,
+                    executor=None):
+        """Bisects the widths `run` would step through until one fits.
+
+        Narrower strips find more gaps, so a width whose gaps cover too
+        little open space sends the search to narrower widths, and one
+        with too much open space or too many buildings to wider widths.
+
+        """
+
+        empty_gaps = gpd.GeoDataFrame(columns=['geometry'],
+                                      geometry='geometry',
+                                      crs='EPSG:4326')
+
+        if min(_ln_ratio, _a, *_is) < 0:
+            self.gaps = empty_gaps
+            return
+
+        # The same widths the linear search steps through, widest first
+        widths = []
+        while _w >= (_w_step/2):
+            widths.append(_w)
+            _w = _w - _w_step
+
+        # Widths before lo are too wide and after hi too narrow
+        lo = -1
+        hi = len(widths)
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            too_wide = None
+
+            for gaps in self._sweep(widths[mid], _ln_ratio, _is, _a,
+                                    executor):
+                self.gaps = gaps
+                if self.fit_check(build_thresh, area_floor, area_ceiling):
+                    return
+
+                # Judge the width on the first number of intersections
+                if too_wide is None:
+                    too_wide = (len(self.gaps) == 0 or
+                                (self.area_ratio <= area_floor and
+                                 self.in_gaps_ratio < build_thresh))
+
+            if too_wide:
+                lo = mid
+            else:
+                hi = mid
+
+        self.gaps = empty_gaps
+
+    def _sweep(self, w, ln_ratio, _is, a, executor=None):
+        """Yields the gaps for each number of intersections in turn.
+
+        The strips only depend on the width, so their gaps are found once
+        and reused for every number of intersections. Without an executor
+        each run happens when its gaps are asked for, so the sweep can stop
+        early. With one, they all start at once.
+
+        """
+
+        width_gaps = _mind_gaps(self._all_pts_coords, w, ln_ratio)
+
+        if executor is None:
+            for i in _is:
+                self.gaps = _mind_polygons(width_gaps, i, a)
+                yield self.gaps
+        else:
+            futures = [executor.submit(_mind_polygons, width_gaps, i, a)
+                       for i in _is]
+            for future in futures:
+                yield future.result()
+
     def parallel_run(self,
                      b_thresh,
                      a_floor,
@@ -282,7 +457,7 @@ class Region:
                      build_thresh=0.07,
                      area_floor=0.2,
                      area_ceiling=0.8,
-                     cpus=mp.cpu_count()-1,
+                     cpus=max(1, mp.cpu_count()-1),
                      _w=0.1,
                      _w_step=0.025,
                      _ln_ratio=2,
@@ -319,38 +494,44 @@ class Region:
         """
 
         # Divide data
-        bounds = self.boundaries.bounds
-
-        min_x = bounds[0]
-        min_y = bounds[1]
-        max_x = bounds[2]
-        max_y = bounds[3]
-
-        cols = list(np.arange(min_x, max_x + tile_size, tile_size))
-        rows = list(np.arange(min_y, max_y + tile_size, tile_size))
-
-        polygons = []
-        for x in cols[:-1]:
-            for y in rows[:-1]:
-                polygons.append(geometry.Polygon([(x,y),
-                                                  (x + tile_size, y),
-                                                  (x + tile_size, y+tile_size),
-                                                  (x, y + tile_size)]))
-        tiles = gpd.GeoDataFrame({'geometry':polygons},crs='EPSG:4326')
+        corners = _square_corners(self.boundaries.bounds, tile_size)
 
         # Clip tiles to region extent
-        tiles = gpd.clip(tiles, self.boundaries_shape)
-
-        # Prepare tiles
-        tile_regions = []
-        for t in tiles['geometry']:
-            bs = gpd.clip(self.buildings, t)
+        tile_inds, tile_shapes = _clip_squares(corners, self.boundaries_shape)
+        tiles = gpd.GeoDataFrame({'geometry':tile_shapes},
+                                 index=tile_inds,
+                                 crs='EPSG:4326')
+
+        # Split buildings between tiles with a single bulk query, rather than
+        # clipping the whole set of buildings once per tile
+        hit_tiles, building_inds = self.buildings.sindex.query(
+            tiles.geometry.values,
+            predicate='intersects',
+            sort=True)
+        tile_splits = np.searchsorted(hit_tiles, np.arange(len(tiles) + 1))
+
+        tile_counts = np.diff(tile_splits)
+
+        # Prepare tiles. A tile without buildings is all gap, so it is
+        # filled in here rather than handed to a worker.
+        gs = [None] * len(tiles)
+        tile_regions = {}
+        for i, t in enumerate(tiles['geometry']):
             t = gpd.GeoDataFrame({'geometry':[t]},crs='EPSG:4326')
-            t_region = Region(bs,t)
-            tile_regions.append(t_region)
+            if tile_counts[i] == 0:
+                gs[i] = t
+                continue
+            in_tile = building_inds[tile_splits[i]:tile_splits[i + 1]]
+            bs = self.buildings.iloc[in_tile]
+            tile_regions[i] = Region(bs,t)
+
+        # Hand out the busiest tiles first so a big tile isn't left running
+        # on its own at the end
+        order = np.argsort(-tile_counts, kind='stable')[:len(tile_regions)]
 
         # Prepare args
-        args = zip(tile_regions,
+        args = zip(order,
+                   [tile_regions[j] for j in order],
                    repeat(build_thresh),
                    repeat(area_floor),
                    repeat(area_ceiling),
@@ -360,9 +541,104 @@ class Region:
                    repeat(_is),
                    repeat(_a))
 
-        # Execute
+        # Execute, collecting tiles as they finish
         with mp.Pool(processes=cpus) as p:
-            gs = p.starmap(Region.parallel_run, args)
+            for j, g in p.imap_unordered(_run_tile, args):
+                gs[j] = g
 
         # Combine gaps
         self.gaps = gpd.GeoDataFrame(pd.concat(gs, ignore_index=True))
+
+
+def _square_corners(bounds, size):
+    """Corners of a grid of squares covering `bounds`.
+
+    Parameters
+    ----------
+    bounds : tuple
+        Bounds to cover (min_x, min_y, max_x, max_y)
+    size : float
+        Size of each square
+
+    Returns
+    -------
+    ndarray
+        Array of shape (n, 4, 2) with the corners of each square,
+        anticlockwise from the lower left, ordered column by column
+
+    """
+
+    min_x, min_y, max_x, max_y = bounds
+
+    # Count squares first so float steps can't add a stray row or column
+    n_cols = int(np.ceil((max_x - min_x) / size))
+    n_rows = int(np.ceil((max_y - min_y) / size))
+    cols = min_x + np.arange(n_cols) * size
+    rows = min_y + np.arange(n_rows) * size
+
+    # Lower left corner of every square
+    x, y = np.meshgrid(cols, rows, indexing='ij')
+    x = x.ravel()
+    y = y.ravel()
+
+    return np.stack([np.column_stack([x, y]),
+                     np.column_stack([x + size, y]),
+                     np.column_stack([x + size, y + size]),
+                     np.column_stack([x, y + size])], axis=1)
+
+def _clip_squares(corners, boundary):
+    """Clip squares to a boundary, the way `gpd.clip` does.
+
+    Only squares crossing the edge of the boundary are intersected with it,
+    squares well inside it are kept whole.
+
+    Parameters
+    ----------
+    corners : ndarray
+        Corners of the squares, as from `_square_corners`
+    boundary : GeoDataFrame
+        Polygons to clip to
+
+    Returns
+    -------
+    ndarray
+        Indices of the squares touching the boundary
+    ndarray
+        Clipped squares, one per index
+
+    """
+
+    boundary_shape = shapely.union_all(boundary.geometry)
+    shapely.prepare(boundary_shape)
+    squares = shapely.polygons(corners)
+    square_tree = shapely.STRtree(squares)
+    inds = square_tree.query(boundary_shape, predicate='intersects')
+    clipped = squares[inds]
+    inside = shapely.contains_properly(boundary_shape, clipped)
+    clipped[~inside] = shapely.intersection(clipped[~inside], boundary_shape)
+    # GEOS hands back an untouched square with its ring reversed, so do
+    # the same for the ones we skipped
+    clipped[inside] = shapely.polygons(corners[inds[inside], ::-1])
+
+    return inds, clipped
+
+def _run_tile(args):
+    """Run one tile for Region.run_parallel, keeping track of its position"""
+
+    j, region, *params = args
+
+    return j, region.parallel_run(*params)
+
+def _mind_gaps(point_coords, w, ln_ratio):
+    """Find the gaps in strips of width `w`, before any are filtered"""
+
+    l = w * ln_ratio + (w / 4)
+
+    return mtg._find_gaps(point_coords, w, w, l, l)
+
+def _mind_polygons(gaps, i, a):
+    """Make gap polygons from the gaps found by `_mind_gaps`"""
+
+    x_gaps, y_gaps = gaps
+
+    return mtg._gap_polygons(x_gaps, y_gaps, i, i, alpha=a)
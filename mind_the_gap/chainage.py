@@ -1,10 +1,8 @@
 """Generate boundary chainage for mind_the_gap"""
 
 import geopandas as gpd
-import pandas as pd
 import numpy as np
-from shapely.ops import unary_union
-from shapely.geometry import MultiPoint
+import shapely
 from shapely.geometry import MultiLineString
 from shapely.geometry import LineString
 
@@ -26,34 +24,31 @@ def chainage(boundary_line, interval, coord_sys='EPSG:4326'):
 
     """
 
-    if isinstance(boundary_line, MultiLineString):
-        chain_points = MultiPoint()
-        for line in boundary_line.geoms:
-            distances = np.arange(0, line.length, interval)
-            points = [line.interpolate(distance) for distance in distances] + \
-                    [line.boundary]
-            points = unary_union(points)
-            chain_points = unary_union([chain_points, points])
+    if not isinstance(boundary_line, (MultiLineString, LineString)):
+        raise TypeError("boundary_line must be LineString or MultiLineString")
 
-        chainage_ds = gpd.GeoSeries(chain_points, crs=coord_sys)
-        chainage_ds = chainage_ds.explode(ignore_index=True)
+    lines = shapely.get_parts(boundary_line)
 
-        return chainage_ds
+    # Distances along each line, flattened, with the line each belongs to.
+    # Each line also gets a point at its full length for its far end.
+    lengths = shapely.length(lines)
+    counts = np.ceil(lengths / interval).astype(int) + 1
+    line_inds = np.repeat(np.arange(len(lines)), counts)
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    distances = (np.arange(counts.sum()) - starts) * interval
+    distances[np.cumsum(counts) - 1] = lengths
 
-    elif isinstance(boundary_line, LineString):
-        chain_points = MultiPoint()
-        distances = np.arange(0, boundary_line.length, interval)
-        points = [boundary_line.interpolate(distance) \
-            for distance in distances] + [boundary_line.boundary]
-        points = unary_union(points)
-        chain_points = unary_union([chain_points, points])
+    # Interpolate every point in one go
+    points = shapely.line_interpolate_point(lines[line_inds], distances)
+    coords = shapely.get_coordinates(points)
 
-        chainage_ds = gpd.GeoSeries(chain_points, crs=coord_sys)
-        chainage_ds = chainage_ds.explode(ignore_index=True)
+    # Drop points shared between lines. Sorting the coordinates gives the
+    # same order a union of the points would.
+    coords = np.unique(coords, axis=0)
 
-        return chainage_ds
-    else:
-        raise TypeError("boundary_line must be LineString or MultiLineString")
+    chainage_ds = gpd.GeoSeries(shapely.points(coords), crs=coord_sys)
+
+    return chainage_ds
 
 def prepare_points(buildings, boundary, interval):
     """Generates a chainage and combines with buildings.
@@ -74,14 +69,14 @@ def prepare_points(buildings, boundary, interval):
     """
 
     # Extract line geometry from boundary
-    boundary_line = ([boundary.boundary][0])[0]
+    boundary_line = boundary.geometry.iloc[0].boundary
 
     # Generate chainage
     chainage_series = chainage(boundary_line, interval)
-    chainage_gdf = gpd.GeoDataFrame(geometry=chainage_series)
 
-    # Combine buildings and chainage
-    all_points_gdf = gpd.GeoDataFrame(pd.concat([buildings,chainage_gdf],
-                                                ignore_index=True))
+    # Combine buildings and chainage, only their geometry is needed
+    points = np.concatenate([np.asarray(buildings.geometry.values),
+                             np.asarray(chainage_series.values)])
+    all_points_gdf = gpd.GeoDataFrame(geometry=points, crs=buildings.crs)
 
     return all_points_gdf
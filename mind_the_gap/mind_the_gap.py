@@ -18,17 +18,12 @@ intersect, or polygons generated by alpha shapes from these points.
 
 __author__ = "Jack Gonzales"
 
-from operator import itemgetter
-from itertools import chain
 
 import numpy as np
 import geopandas as gpd
 import shapely
 from libpysal.cg import alpha_shape
-from shapely.geometry import LineString
-from shapely.geometry import Point
-from shapely.geometry import MultiPoint
-from shapely.geometry import MultiPolygon
+from numba import njit
 
 # -----------------Put coordinates in np array----------------
 def get_coordinates(points):
@@ -42,26 +37,135 @@ def get_coordinates(points):
     Returns
     -------
     ndarray
-        Array of point coordinates (x,y)
+        Array of point coordinates (x,y). MultiPoints give one row for each
+        of their points.
     
     """
 
-    point_geom = points['geometry']
+    geoms = np.asarray(points['geometry'].values)
+
+    # MultiPoints contribute each of their points, in place
+    is_multi = shapely.get_type_id(geoms) == 4
+    n_parts = np.where(is_multi, shapely.get_num_geometries(geoms), 1)
+    point_geom = np.repeat(geoms, n_parts)
+    point_geom[np.repeat(is_multi, n_parts)] = \
+        shapely.get_parts(geoms[is_multi])
 
     points_coords = np.zeros([np.size(point_geom),2])
 
-    for i, point in enumerate(point_geom):
-        if isinstance(point, MultiPoint):
-            for p in point.geoms:
-                points_coords[i,0] = p.x
-                points_coords[i,1] = p.y
-        elif isinstance(point, Point):
-            points_coords[i,0] = point.x
-            points_coords[i,1] = point.y
+    # Anything that isn't a point is left at the origin
+    is_point = ((shapely.get_type_id(point_geom) == 0) &
+                ~shapely.is_empty(point_geom))
+    points_coords[is_point] = shapely.get_coordinates(point_geom[is_point])
 
     return points_coords
 
 # ----------Put points into bins based on lat and lon---------
+@njit(cache=True)
+def _nearest_bins(coords, bins):
+    """Finds the index of the closest bin to each coordinate.
+
+    Points exactly halfway between two bins are left in bin 0.
+
+    Parameters
+    ----------
+    coords : ndarray
+        1-d array of point coordinates along one axis
+    bins : ndarray
+        1-d array of bin coordinates along the same axis
+
+    Returns
+    -------
+    ndarray
+        Bin index for each coordinate
+
+    """
+
+    bin_assignment = np.zeros(coords.shape[0])
+    n_bins = bins.shape[0]
+    if n_bins == 0:
+        return bin_assignment
+
+    # Bins are evenly spaced, so the nearest one can be worked out directly
+    # and only its neighbours need checking
+    bin_size = bins[1] - bins[0] if n_bins > 1 else 1.0
+
+    for i in range(coords.shape[0]):
+        if not np.isfinite(coords[i]):
+            continue
+
+        guess = int(np.rint((coords[i] - bins[0]) / bin_size))
+        first = min(max(guess - 1, 0), n_bins - 1)
+        last = max(min(guess + 1, n_bins - 1), 0)
+
+        min_diff = np.inf
+        bin_index = 0
+        ties = 0
+        for j in range(first, last + 1):
+            diff = abs(coords[i] - bins[j])
+            if diff < min_diff:
+                min_diff = diff
+                bin_index = j
+                ties = 1
+            elif diff == min_diff:
+                ties += 1
+
+        if ties == 1:
+            bin_assignment[i] = bin_index
+
+    return bin_assignment
+
+@njit(cache=True)
+def _find_strip_gaps(bin_inds, coords, bins, gap_length_threshold):
+    """Finds gaps between successive points in each bin.
+
+    Parameters
+    ----------
+    bin_inds : ndarray
+        Integer bin index of each point, sorted
+    coords : ndarray
+        Coordinate of each point along the bins, sorted within each bin
+    bins : ndarray
+        Coordinates of the bins
+    gap_length_threshold : float
+        Minimum length gaps must meet to be returned
+
+    Returns
+    -------
+    ndarray
+        Array of shape (n, 7) with one gap per row, in the format returned
+        by `find_lat_gaps` and `find_lon_gaps`
+
+    """
+
+    n_points = coords.shape[0]
+    gaps = np.empty((max(n_points - 1, 0), 7))
+    n_gaps = 0
+
+    start = 0
+    while start < n_points:
+        # Points in this bin run from start up to end
+        end = start + 1
+        while end < n_points and bin_inds[end] == bin_inds[start]:
+            end += 1
+
+        bin_index = bin_inds[start]
+        for k in range(start, end - 1):
+            dist = coords[k + 1] - coords[k]
+            if dist >= gap_length_threshold:
+                gaps[n_gaps, 0] = bin_index
+                gaps[n_gaps, 1] = bins[bin_index]
+                gaps[n_gaps, 2] = k - start
+                gaps[n_gaps, 3] = coords[k]
+                gaps[n_gaps, 4] = k - start + 1
+                gaps[n_gaps, 5] = coords[k + 1]
+                gaps[n_gaps, 6] = dist
+                n_gaps += 1
+
+        start = end
+
+    return gaps[:n_gaps]
+
 def into_the_bins(points, x_bin_size=0.005, y_bin_size=0.005):
     """Sorts points into latidude and longitude bins.
 
@@ -116,22 +220,13 @@ def into_the_bins(points, x_bin_size=0.005, y_bin_size=0.005):
 
         """
 
-        x_max = max(points[:,0])
-        x_min = min(points[:,0])
+        x_max = points[:,0].max()
+        x_min = points[:,0].min()
         bins = np.arange(x_min, (x_max + bin_size), step=bin_size)
 
-        # build extra column of which bin index each point goes in
-        bin_assignment = np.zeros(np.shape(points[:,0]))
-
         # put points into whichever bin they are closest to
-        for i, _ in enumerate(bin_assignment):
-            diffs = np.abs(points[i,0] - bins[:])
-            bin_index = np.where(min(diffs) == np.abs(points[i,0]-bins[:]))[0]
-
-            if len(bin_index) > 1:
-                continue
-
-            bin_assignment[i] = bin_index
+        bin_assignment = _nearest_bins(np.ascontiguousarray(points[:,0]),
+                                       bins)
 
         return bin_assignment, bins
 
@@ -157,34 +252,25 @@ def into_the_bins(points, x_bin_size=0.005, y_bin_size=0.005):
 
         """
 
-        y_max = max(points[:,1])
-        y_min = min(points[:,1])
+        y_max = points[:,1].max()
+        y_min = points[:,1].min()
         bins = np.arange(y_min, (y_max + bin_size), step=bin_size)
 
 
-        # build extra column of which bin index each point goes in
-        bin_assignment = np.zeros(np.shape(points[:,1]))
-
         # put points into whichever bin they are closest to
-        for i, _ in enumerate(bin_assignment):
-            diffs = np.abs(points[i,1] - bins[:])
-            bin_index = np.where(min(diffs) ==
-                                 np.abs(points[i,1] - bins[:]))[0]
-
-            if len(bin_index) > 1:
-                continue
-
-            bin_assignment[i] = bin_index
+        bin_assignment = _nearest_bins(np.ascontiguousarray(points[:,1]),
+                                       bins)
 
         return bin_assignment, bins
 
     bin_x_indices, x_bins = into_the_x_bins(points, x_bin_size)
     bin_y_indices, y_bins = into_the_y_bins(points, y_bin_size)
 
-    points_in_bins = np.vstack((points[:,0],
-                                points[:,1],
-                                bin_y_indices,
-                                bin_x_indices)).T
+    # Fill the columns in place rather than stacking and transposing
+    points_in_bins = np.empty((len(points), 4))
+    points_in_bins[:,:2] = points
+    points_in_bins[:,2] = bin_y_indices
+    points_in_bins[:,3] = bin_x_indices
 
     return points_in_bins, x_bins, y_bins
 
@@ -219,46 +305,18 @@ def find_lat_gaps(points, bins, gap_length_threshold=0.05):
 
     """
 
-    gaps = []
+    points = np.asarray(points, dtype=float)
 
-    for i, binn in enumerate(bins):
-        # Find indices of points in that bin
-        indices_in_bin = np.where(points[:,3] == i)[0]
+    # Sort points by bin, then by latitude within each bin
+    bin_inds = points[:,3].astype(np.int32)
+    order = np.lexsort((points[:,1], bin_inds))
 
-        # If there aren't any gaps in this bin, skip to the next one
-        if np.shape(indices_in_bin)[0] == 0:
-            continue
+    gaps = _find_strip_gaps(bin_inds[order],
+                            points[order,1],
+                            np.asarray(bins, dtype=float),
+                            float(gap_length_threshold))
 
-        # Sort latitudes into numerical order
-        lats_in_bin = points[indices_in_bin,1]
-        lats_sorted = lats_in_bin[np.argsort(lats_in_bin)]
-
-        # Calcuate distances between each successive point
-        lats_bottom = lats_sorted[0:len(lats_sorted) - 1]
-        lats_top = lats_sorted[1:len(lats_sorted)]
-        succ_dists = lats_top - lats_bottom
-        successive_dists = succ_dists
-
-        # Do some basic stats
-        dist_max = max(successive_dists)
-
-        # If large gaps are present, where are they?
-        if dist_max >= (gap_length_threshold):
-            big_dist_inds = np.where(successive_dists >=
-                                     (gap_length_threshold))[0]
-
-            # Append each gap's info to list of all gaps
-            for gap_ind in big_dist_inds:
-                this_gap = [i,
-                            binn,
-                            gap_ind,
-                            lats_sorted[gap_ind],
-                            gap_ind + 1,
-                            lats_sorted[gap_ind + 1],
-                            successive_dists[gap_ind]]
-                gaps.append(this_gap)
-
-    return gaps
+    return gaps.tolist()
 
 # ----------------Go through y_bins to find gaps---------------
 def find_lon_gaps(points, bins, gap_length_threshold=0.05):
@@ -290,46 +348,18 @@ def find_lon_gaps(points, bins, gap_length_threshold=0.05):
 
     """
 
-    gaps = []
+    points = np.asarray(points, dtype=float)
 
-    for i, binn in enumerate(bins):
-        # Find indices of points in that bin
-        indices_in_bin = np.where(points[:,2] == i)[0]
+    # Sort points by bin, then by longitude within each bin
+    bin_inds = points[:,2].astype(np.int32)
+    order = np.lexsort((points[:,0], bin_inds))
 
-        # If there aren't any gaps in this bin, skip to the next one
-        if np.shape(indices_in_bin)[0] == 0:
-            i += 1 # Is this a bug? Shouldn't- i increase by one with continue?
-            continue
+    gaps = _find_strip_gaps(bin_inds[order],
+                            points[order,0],
+                            np.asarray(bins, dtype=float),
+                            float(gap_length_threshold))
 
-        # Sort latitudes into numerical order
-        lons_in_bin = points[indices_in_bin,0]
-        lons_sorted = lons_in_bin[np.argsort(lons_in_bin)]
-
-        # Calcuate distances between each successive point
-        lons_bottom = lons_sorted[0:len(lons_sorted) - 1]
-        lons_top = lons_sorted[1:len(lons_sorted)]
-        succ_dists = lons_top - lons_bottom
-        successive_dists = succ_dists
-
-        # Do some basic stats
-        dist_max = max(successive_dists)
-
-        # If large gaps are present, where are they?
-        if dist_max >= (gap_length_threshold):
-            big_dist_inds = np.where(successive_dists >=
-                                     (gap_length_threshold))[0]
-            # Append each gap's info to list of all gaps
-            for gap_ind in big_dist_inds:
-                this_gap = [i,
-                            binn,
-                            gap_ind,
-                            lons_sorted[gap_ind],
-                            gap_ind + 1,
-                            lons_sorted[gap_ind + 1],
-                            successive_dists[gap_ind]]
-                gaps.append(this_gap)
-
-    return gaps
+    return gaps.tolist()
 
 # --------------Find if a pair of segments cross--------------
 def does_cross(x_gap, y_gap):
@@ -371,12 +401,211 @@ def does_cross(x_gap, y_gap):
 
     return False
 
+def _gap_coords(gaps):
+    """Gets the coordinates of gaps as one contiguous row each.
+
+    Parameters
+    ----------
+    gaps : ndarray
+        Array of gaps, in the same format as `find_lat_gaps` or
+        `find_lon_gaps`
+
+    Returns
+    -------
+    ndarray
+        Array of shape (3, n) with the bin coordinates, endpoint 1
+        coordinates and endpoint 2 coordinates of the gaps
+
+    """
+
+    return np.ascontiguousarray(gaps[:,[1,3,5]].T, dtype=float)
+
+@njit(cache=True)
+def _crossing_pairs(x_gaps, y_gaps):
+    """Finds every pair of an x gap and a y gap that cross.
+
+    Parameters
+    ----------
+    x_gaps : ndarray
+        Array of shape (3, n) with the lon coordinates and the two endpoint
+        lat coordinates of the x gaps, as from `_gap_coords`
+    y_gaps : ndarray
+        Array of shape (3, m) with the lat coordinates and the two endpoint
+        lon coordinates of the y gaps, as from `_gap_coords`
+
+    Returns
+    -------
+    x_inds : ndarray
+        Index in `x_gaps` of each crossing
+    y_inds : ndarray
+        Index in `y_gaps` of each crossing
+
+    """
+
+    # Bucket y gaps by which x gap lon coordinates they span, CSR style
+    cols = np.unique(x_gaps[0])
+    x_cols = np.searchsorted(cols, x_gaps[0])
+    col_los = np.searchsorted(cols, y_gaps[1], side='left')
+    col_his = np.searchsorted(cols, y_gaps[2], side='right')
+
+    indptr = np.zeros(len(cols) + 1, dtype=np.int64)
+    for o in range(y_gaps.shape[1]):
+        for c in range(col_los[o], col_his[o]):
+            indptr[c + 1] += 1
+    indptr = np.cumsum(indptr)
+
+    # Fill buckets in latitude order, so each bucket is sorted by latitude
+    indices = np.empty(indptr[-1], dtype=np.int64)
+    lats = np.empty(indptr[-1])
+    fill = indptr[:-1].copy()
+    for o in np.argsort(y_gaps[0]):
+        for c in range(col_los[o], col_his[o]):
+            indices[fill[c]] = o
+            lats[fill[c]] = y_gaps[0, o]
+            fill[c] += 1
+
+    # Every y gap in an x gap's bucket within its latitude range crosses it
+    firsts = np.empty(x_gaps.shape[1], dtype=np.int64)
+    lasts = np.empty(x_gaps.shape[1], dtype=np.int64)
+    for i in range(x_gaps.shape[1]):
+        start = indptr[x_cols[i]]
+        bucket = lats[start:indptr[x_cols[i] + 1]]
+        firsts[i] = start + np.searchsorted(bucket, x_gaps[1, i],
+                                            side='left')
+        lasts[i] = start + np.searchsorted(bucket, x_gaps[2, i],
+                                           side='right')
+
+    n_pairs = np.sum(lasts - firsts)
+    x_inds = np.repeat(np.arange(x_gaps.shape[1]), lasts - firsts)
+    y_inds = np.empty(n_pairs, dtype=np.int64)
+    n_pairs = 0
+    for i in range(x_gaps.shape[1]):
+        for k in range(firsts[i], lasts[i]):
+            y_inds[n_pairs] = indices[k]
+            n_pairs += 1
+
+    return x_inds, y_inds
+
+@njit(cache=True)
+def _peel_gaps(x_inds,
+               y_inds,
+               n_x_gaps,
+               n_y_gaps,
+               x_min_intersections,
+               y_min_intersections):
+    """Drops gaps with too few crossings until all gaps left have enough.
+
+    Parameters
+    ----------
+    x_inds : ndarray
+        Index of the x gap of each crossing, as from `_crossing_pairs`
+    y_inds : ndarray
+        Index of the y gap of each crossing, as from `_crossing_pairs`
+    n_x_gaps : int
+        Number of x gaps
+    n_y_gaps : int
+        Number of y gaps
+    x_min_intersections : int
+        Minumum number of crossings an x gap must have to be kept
+    y_min_intersections : int
+        Minumum number of crossings a y gap must have to be kept
+
+    Returns
+    -------
+    keep_x : ndarray
+        True for each x gap that is kept
+    keep_y : ndarray
+        True for each y gap that is kept
+
+    """
+
+    # Number y gaps after x gaps, so both share one list of neighbours
+    n_gaps = n_x_gaps + n_y_gaps
+    firsts = np.concatenate((x_inds, y_inds + n_x_gaps))
+    seconds = np.concatenate((y_inds + n_x_gaps, x_inds))
+
+    counts = np.bincount(firsts, minlength=n_gaps)
+    indptr = np.zeros(n_gaps + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(counts)
+    neighbours = seconds[np.argsort(firsts, kind='mergesort')]
+
+    min_counts = np.empty(n_gaps)
+    min_counts[:n_x_gaps] = x_min_intersections
+    min_counts[n_x_gaps:] = y_min_intersections
+
+    # Start from every gap that is already short of crossings
+    keep = np.ones(n_gaps, dtype=np.bool_)
+    stack = np.empty(n_gaps, dtype=np.int64)
+    n_stack = 0
+    for i in range(n_gaps):
+        if counts[i] < min_counts[i]:
+            keep[i] = False
+            stack[n_stack] = i
+            n_stack += 1
+
+    # Dropping a gap takes a crossing away from each gap it crossed, which
+    # may leave those short too
+    while n_stack > 0:
+        n_stack -= 1
+        i = stack[n_stack]
+        for k in range(indptr[i], indptr[i + 1]):
+            j = neighbours[k]
+            if keep[j]:
+                counts[j] -= 1
+                if counts[j] < min_counts[j]:
+                    keep[j] = False
+                    stack[n_stack] = j
+                    n_stack += 1
+
+    return keep[:n_x_gaps], keep[n_x_gaps:]
+
+@njit(cache=True)
+def _union_find(n, firsts, seconds):
+    """Joins linked items into sets with a disjoint-set forest.
+
+    Parameters
+    ----------
+    n : int
+        Number of items
+    firsts : ndarray
+        Index of the first item of each link
+    seconds : ndarray
+        Index of the second item of each link
+
+    Returns
+    -------
+    ndarray
+        Index of the root item of the set each item is in
+
+    """
+
+    parent = np.arange(n)
+
+    for k in range(firsts.shape[0]):
+        # Find both roots, halving the paths on the way
+        a = firsts[k]
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        b = seconds[k]
+        while parent[b] != b:
+            parent[b] = parent[parent[b]]
+            b = parent[b]
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+
+    # Point every item straight at its root
+    for i in range(n):
+        parent[i] = parent[parent[i]]
+
+    return parent
+
 # ---------------------Find intersections---------------------
 def find_intersections(gap_LineStrings):
     """Finds intersections amongst a set of LineStrings.
 
-    Finds intersections between LineStrings using the
-    shapely.LineString.intersection method.
+    Finds intersections between LineStrings using shapely.intersection on
+    the pairs of lines found by an STRtree query.
 
     Parameters
     ----------
@@ -398,18 +627,99 @@ def find_intersections(gap_LineStrings):
 
     """
 
-    intersections = []
-    for y, _ in enumerate(gap_LineStrings):
-        ln1 = gap_LineStrings[y]
-        for h, __ in enumerate(gap_LineStrings):
-            ln2 = gap_LineStrings[h]
-            cross = ln1.intersection(ln2)
-            if cross.is_empty or y == h or isinstance(cross, LineString):
-                continue
-            else:
-                intersections.append(cross)
+    lines = np.empty(len(gap_LineStrings), dtype=object)
+    lines[:] = gap_LineStrings
+
+    # Only intersect pairs of lines that actually meet, each pair once
+    tree = shapely.STRtree(lines)
+    firsts, seconds = tree.query(lines, predicate='intersects')
+    once = firsts < seconds
+    firsts = firsts[once]
+    seconds = seconds[once]
+
+    crosses = shapely.intersection(lines[firsts], lines[seconds])
+
+    # Overlapping lines intersect in a line, which isn't a crossing
+    is_point = ~shapely.is_empty(crosses) & \
+        (shapely.get_type_id(crosses) != shapely.GeometryType.LINESTRING)
+    firsts = firsts[is_point]
+    seconds = seconds[is_point]
+    crosses = crosses[is_point]
 
-    return intersections
+    # Each crossing is found from both lines, in the same order as looping
+    # over every line against every other line
+    order = np.lexsort((np.r_[seconds, firsts], np.r_[firsts, seconds]))
+
+    return np.r_[crosses, crosses][order].tolist()
+
+def _gap_intersections(x_segments, y_segments):
+    """Finds intersections amongst gap segments without shapely.
+
+    Gives the same points as `find_intersections` on the LineStrings of
+    the x gaps followed by the y gaps, but works them out from the
+    coordinates, since x gaps are vertical and y gaps are horizontal.
+
+    Parameters
+    ----------
+    x_segments : ndarray
+        Array of shape (n, 2, 2) with the endpoints of each x gap
+    y_segments : ndarray
+        Array of shape (m, 2, 2) with the endpoints of each y gap
+
+    Returns
+    -------
+    ndarray
+        Array of shape (k, 2) with the coordinates of each intersection
+        between gaps
+
+    Notes
+    -----
+    Gaps in the same strip are assumed not to overlap, as is the case for
+    gaps from `find_lat_gaps` and `find_lon_gaps`.
+
+    """
+
+    def touching(coords):
+        """Pairs of gaps in the same strip that meet end to end"""
+
+        order = np.lexsort((coords[1], coords[0]))
+        coords = coords[:,order]
+        touch = ((coords[0,1:] == coords[0,:-1]) &
+                 (coords[1,1:] == coords[2,:-1]))
+
+        return order[:-1][touch], order[1:][touch]
+
+    n_x = len(x_segments)
+
+    # Strip coordinate and the two endpoint coordinates of each gap
+    x_coords = np.ascontiguousarray(x_segments.reshape(-1, 4)[:,[0,1,3]].T,
+                                    dtype=float)
+    y_coords = np.ascontiguousarray(y_segments.reshape(-1, 4)[:,[1,0,2]].T,
+                                    dtype=float)
+
+    # An x gap and a y gap meet where they cross
+    x_inds, y_inds = _crossing_pairs(x_coords, y_coords)
+    crosses = np.column_stack([x_coords[0,x_inds], y_coords[0,y_inds]])
+
+    # Gaps in the same strip meet where one ends and the next starts
+    x_firsts, x_seconds = touching(x_coords)
+    x_touches = np.column_stack([x_coords[0,x_firsts],
+                                 x_coords[2,x_firsts]])
+    y_firsts, y_seconds = touching(y_coords)
+    y_touches = np.column_stack([y_coords[2,y_firsts],
+                                 y_coords[0,y_firsts]])
+
+    # Each point is found from both gaps, in the same order as looping
+    # over every gap against every other gap
+    firsts = np.r_[x_inds, y_inds + n_x, x_firsts, x_seconds,
+                   y_firsts + n_x, y_seconds + n_x]
+    seconds = np.r_[y_inds + n_x, x_inds, x_seconds, x_firsts,
+                    y_seconds + n_x, y_firsts + n_x]
+    coords = np.vstack([crosses, crosses, x_touches, x_touches,
+                        y_touches, y_touches])
+    order = np.lexsort((seconds, firsts))
+
+    return coords[order]
 
 # -----------Filter out gaps with few intersections-----------
 def intersection_filter(x_gaps,
@@ -453,50 +763,24 @@ def intersection_filter(x_gaps,
     x_gaps = np.asarray(x_gaps)
     y_gaps = np.asarray(y_gaps)
 
-    # Filter repeatedly until things stop changing
-    prev_x_gaps_num = 0
-    prev_y_gaps_num = 0
-    iterations = 0
-
-    while True:
-        # If either has no gaps, there can be no intersections
-        if np.shape(x_gaps)[0] < 1 or np.shape(y_gaps)[0] < 1:
-            x_gaps = np.ndarray(0)
-            y_gaps = np.ndarray(0)
-            break
-
-        x_gap_does_cross = np.zeros(np.shape(x_gaps[:,1])[0])
-        y_gap_does_cross = np.zeros(np.shape(y_gaps[:,1])[0])
-
-        for i, _ in enumerate(x_gaps[:,1]):
-            thisx_gap = x_gaps[i,:]
-            for o, __ in enumerate(y_gaps[:,1]):
-                thisy_gap = y_gaps[o,:]
-
-                if does_cross(thisx_gap, thisy_gap):
-                    y_gap_does_cross[o] += 1
-                    x_gap_does_cross[i] += 1
-
-        # Remove gaps that don't have any connections
-        connecting_x_gaps = np.where(x_gap_does_cross >=
-                                     x_min_intersections)[0]
-        x_gaps = x_gaps[connecting_x_gaps]
-        connecting_y_gaps = np.where(y_gap_does_cross >=
-                                     y_min_intersections)[0]
-        y_gaps = y_gaps[connecting_y_gaps]
-
-        # Compare number of gaps to previous iteration
-        x_gaps_num_diff = np.shape(x_gaps[:,1])[0] - prev_x_gaps_num
-        y_gaps_num_diff = np.shape(y_gaps[:,1])[0] - prev_y_gaps_num
-
-        if x_gaps_num_diff == 0 and y_gaps_num_diff == 0:
-            break
-
-        # Save number of gaps for this iteration
-        prev_x_gaps_num = np.shape(x_gaps[:,1])[0]
-        prev_y_gaps_num = np.shape(y_gaps[:,1])[0]
-
-        iterations += 1
+    # If either has no gaps, there can be no intersections
+    if np.shape(x_gaps)[0] < 1 or np.shape(y_gaps)[0] < 1:
+        return np.ndarray(0), np.ndarray(0)
+
+    # Find every crossing once, then peel gaps off until none are short
+    x_inds, y_inds = _crossing_pairs(_gap_coords(x_gaps),
+                                     _gap_coords(y_gaps))
+    keep_x, keep_y = _peel_gaps(x_inds,
+                                y_inds,
+                                len(x_gaps),
+                                len(y_gaps),
+                                x_min_intersections,
+                                y_min_intersections)
+    x_gaps = x_gaps[keep_x]
+    y_gaps = y_gaps[keep_y]
+
+    if np.shape(x_gaps)[0] < 1 or np.shape(y_gaps)[0] < 1:
+        return np.ndarray(0), np.ndarray(0)
 
     return x_gaps, y_gaps
 
@@ -527,111 +811,33 @@ def find_clusters(x_gaps, y_gaps):
     gap_cluster_IDs : ndarray
         Array of unique ID numbers for each cluster, indexing from one.
     clusters : list
-        List containing a list of indices refering to `all_gaps` for each
-        cluster
+        List containing a sorted list of indices refering to `all_gaps` for
+        each cluster
     split_index : int
         Index of where `all_gaps` shifts from being x_gaps to y_gaps
 
     """
 
-    def take_a_walk(gaps,start_ind,done_inds=[],cross_inds=[]):
-        """Finds all lines in a network of interconnecting lines.
-
-        Starting from one gap/line segment, this function gets all other
-        line segments that intersect with the start line segment, and adds
-        the indices of those intersecting lines in `gaps` to a list. Then,
-        for each intersecting line segment not already in the list of
-        intersecting indices, the function recursively calls itself to find
-        all line segments that intersect with each of those line segments,
-        and then calls itself again, etc. This finally ends when all line
-        segments of a cluster are added to `cross_inds` and no more recursive
-        calls are made.
-
-        Parameters
-        ----------
-        gaps : array_like
-            `all_gaps` from the parent function
-        start_ind : int
-            Index in `gaps` of the first gap to test
-        done_inds : array_like, optional
-            Indices of gaps that have already been tested
-        cross_inds : array_like, optional
-            Indices of line segments that cross at least one other line segment
-            in the cluster
-
-        Returns
-        -------
-        cross_inds : array_like
-            Indices in `gaps` (`all_gaps` in parent function) of line segments
-            that are in the cluster
-
-        """
-
-        # Make sure we haven't already ran this index
-        if start_ind in done_inds:
-            return
-        else:
-            done_inds.append(start_ind)
-
-        # Define test gap
-        test_gap = gaps[start_ind,:]
-
-        # Find which other gaps intersect with our test gap
-        for i, _ in enumerate(gaps[:,1]):
-            # If the gap crosses our test gap and isn't already in cross_inds,
-            # then we append it. We also make recursive call of take_a_walk
-            if does_cross(test_gap,gaps[i,:]) and not i in cross_inds:
-                cross_inds.append(i)
-                cross_inds.append(take_a_walk(gaps,
-                                              i,
-                                              done_inds,
-                                              cross_inds=cross_inds))
-
-        return cross_inds
-
     # Stack all gaps into one big array
     all_gaps = np.vstack([x_gaps,y_gaps])
     # Get the index that splits x_gaps and y_gaps
     split_index = np.shape(x_gaps[:,1])[0]
-    # Create array of cluster IDs
-    gap_cluster_ids = np.zeros(np.shape(all_gaps[:,1])[0])
-
-    # Make lists of clusters and all indices in clusters
-    clusters = []
-    in_clusters = []
-
-    # Make list of all gap indices
-    all_gap_inds = list(range(0,len(all_gaps[:,0])))
-
-    # start cluster ID
-    cluster_id = 1
-
-    # Sort into clusters
-    while in_clusters.sort() != all_gap_inds:
-        # Find the gap we want to walk from: the first gap that hasn't yet been
-        # assigned to a cluster. If an IndexError is thrown, then all gaps have
-        # been sorted into clusters and we break out of the loop
-        try:
-            walk_ind = np.where(gap_cluster_ids == 0)[0][0]
-        except IndexError:
-            break
-
-        in_cluster = take_a_walk(all_gaps,
-                                 walk_ind,
-                                 done_inds=[],
-                                 cross_inds=[])
-
-        # take_a_walk returns a very messy list, including other lists.
-        # We only want the integers from it.
-        in_cluster = list([elm for elm in in_cluster if isinstance(elm, int)])
-        # append all gaps in a cluster into list of lists of cluster indices
-        clusters.append(in_cluster)
-        # Add gaps to list of all clustered indices
-        in_clusters += in_cluster
-        # Assign all gaps in that cluster with their cluster ID
-        gap_cluster_ids[in_cluster] = cluster_id
-        # Move to next cluster ID
-        cluster_id += 1
+
+    # Link every pair of gaps where `does_cross` holds, testing all gaps
+    # against all gaps rather than only x gaps against y gaps
+    coords = _gap_coords(all_gaps)
+    firsts, seconds = _crossing_pairs(coords, coords)
+    roots = _union_find(len(all_gaps), firsts, seconds)
+
+    # Roots are always the lowest index in their cluster, so numbering
+    # them in order numbers clusters by their first gap
+    _, gap_cluster_ids = np.unique(roots, return_inverse=True)
+    gap_cluster_ids = gap_cluster_ids + 1.0
+
+    # Make list of clusters
+    order = np.argsort(gap_cluster_ids, kind='stable')
+    splits = np.flatnonzero(np.diff(gap_cluster_ids[order])) + 1
+    clusters = [c.tolist() for c in np.split(order, splits)]
 
     return all_gaps, gap_cluster_ids, clusters, split_index
 
@@ -658,26 +864,11 @@ def cluster_intersections(x_inds, y_inds, gaps):
 
     """
 
-    intersections = []
+    segments = np.asarray(gaps, dtype=float)
+    coords = _gap_intersections(segments[np.asarray(x_inds, dtype=int)],
+                                segments[np.asarray(y_inds, dtype=int)])
 
-    x_gaps = list(itemgetter(*x_inds)(gaps))
-    y_gaps = list(itemgetter(*y_inds)(gaps))
-
-
-    # Make linestrings
-    gap_LineStrings = []
-
-    for gap in x_gaps:
-        this_gap_ls = LineString(gap)
-        gap_LineStrings.append(this_gap_ls)
-
-    for gap in y_gaps:
-        this_gap_ls = LineString(gap)
-        gap_LineStrings.append(this_gap_ls)
-
-    intersections = find_intersections(gap_LineStrings)
-
-    return intersections
+    return shapely.points(coords).tolist()
 
 # -------------Generate polygons with alpha_shapes-------------
 def generate_alpha_polygons(x_clusters, y_clusters, gaps, alpha):
@@ -703,13 +894,14 @@ def generate_alpha_polygons(x_clusters, y_clusters, gaps, alpha):
 
     """
 
-    def make_alpha_shape(points, alpha):
+    def make_alpha_shape(xy, alpha):
         """Generate alpha_shapes with the libpysal alpha_shape module.
 
         Parameters
         ----------
-        points : MultiPoint object
-            shapely multipoint object containing points of one cluster
+        xy : ndarray
+            Array of shape (n, 2) with the coordinates of the points of one
+            cluster
         alpha : int
             The alpha value used for the alpha shapes function
 
@@ -720,45 +912,31 @@ def generate_alpha_polygons(x_clusters, y_clusters, gaps, alpha):
 
         """
 
-        xs = np.asarray([point.x for point in points.geoms])
-        ys = np.asarray([point.y for point in points.geoms])
-
-        xy = np.vstack([xs,ys]).T
-
         shape = alpha_shape(xy, alpha)
         return shape
 
+    segments = np.asarray(gaps, dtype=float)
+
     shapes = []
     all_inters = []
 
-    for i, _ in enumerate(x_clusters):
-        x_inds = x_clusters[i]
-        y_inds = y_clusters[i]
-
-        inters = cluster_intersections(x_inds, y_inds, gaps)
-        # Add gap segment endpoints to the gap intersections
-        x_gaps = list(itemgetter(*x_inds)(gaps))
-        y_gaps = list(itemgetter(*y_inds)(gaps))
-        cluster_gaps = [x_gaps, y_gaps] 
-        gap_ends = list(chain(*cluster_gaps))
-        gap_ends = list(chain(*gap_ends))
-        gap_ends = list(map(list, gap_ends))
-        endpoints = MultiPoint(gap_ends)
-        inters = MultiPoint(inters)
-        inters = shapely.ops.unary_union([endpoints,inters])
-
-        a_shape = make_alpha_shape(inters, alpha)
-        if len(a_shape) > 0:
-            a_shape = a_shape[0]
-
-        inters = MultiPoint(inters)
-        all_inters.append([inters])
-
-        if isinstance(a_shape, MultiPolygon): # Only put polygons into list
-            for sh in a_shape:
-                shapes.append(sh)
-        else:
-            shapes.append(a_shape)
+    for x_inds, y_inds in zip(x_clusters, y_clusters):
+        x_inds = np.asarray(x_inds, dtype=int)
+        y_inds = np.asarray(y_inds, dtype=int)
+        inters = _gap_intersections(segments[x_inds], segments[y_inds])
+        # Add gap segment endpoints to the gap intersections, dropping
+        # repeated points
+        gap_ends = segments[np.r_[x_inds, y_inds]].reshape(-1, 2)
+        xy = np.unique(np.vstack([gap_ends, inters]), axis=0)
+
+        # Keep the first shape, if the points make one at all
+        a_shape = make_alpha_shape(xy, alpha)
+        shapes.extend(np.asarray(a_shape)[:1])
+
+        all_inters.append([shapely.multipoints(xy)])
+
+    # Only put polygons into list, splitting up multipolygons
+    shapes = shapely.get_parts(shapes).tolist()
 
     gaps_df = gpd.GeoDataFrame(shapes,columns=['geometry'],crs="EPSG:4326")
     gaps_df.set_geometry(col='geometry', inplace=True)
@@ -823,52 +1001,60 @@ def mind_the_gap(in_points,
 
     """
 
-    def gen_gap_LineStrings(x_gaps, y_gaps):
-        """Converts data gaps from ndarrays to shapely linestrings"""
-
-        x_gaps = np.asarray(x_gaps)
-        x_gap_segments = []
-        x_gap_LineStrings = []
-        for o, _ in enumerate(x_gaps[:,0]):
-            # Get segments ready to plot
-            this_gapSegment = [(x_gaps[o,1], x_gaps[o,3]),\
-                              (x_gaps[o,1], x_gaps[o,5])]
-            x_gap_segments.append(this_gapSegment)
-
-            # Make LineStrings for Shapely
-            this_line = LineString([(x_gaps[o,1], x_gaps[o,3]),\
-                                   (x_gaps[o,1], x_gaps[o,5])])
-            x_gap_LineStrings.append(this_line)
-
-        all_gap_segments = x_gap_segments
-        all_gap_LineStrings = x_gap_LineStrings
-        y_gaps = np.asarray(y_gaps)
-        y_gap_segments = []
-        y_gap_LineStrings = []
-        for u, __ in enumerate(y_gaps[:,0]):
-            # Get segments ready to plot
-            this_gapSegment = [(y_gaps[u,3], y_gaps[u,1]),\
-                               (y_gaps[u,5], y_gaps[u,1])]
-            y_gap_segments.append(this_gapSegment)
-            all_gap_segments.append(this_gapSegment)
-
-            # Make LineStrings for Shapely
-            this_line = LineString([(y_gaps[u,3], y_gaps[u,1]), \
-                                    (y_gaps[u,5], y_gaps[u,1])])
-            y_gap_LineStrings.append(this_line)
-            all_gap_LineStrings.append(this_line)
-
-        return all_gap_LineStrings, all_gap_segments, x_gap_LineStrings, \
-            y_gap_LineStrings
+    #Load in building centroids
+    point_coords = get_coordinates(in_points)
+
+    x_gaps, y_gaps = _find_gaps(point_coords,
+                                x_bin_size,
+                                y_bin_size,
+                                x_gap_len_threshold,
+                                y_gap_len_threshold)
+
+    return _gap_polygons(x_gaps,
+                         y_gaps,
+                         x_min_intersections,
+                         y_min_intersections,
+                         alpha,
+                         cluster_points,
+                         write_points)
+
+def _find_gaps(point_coords,
+               x_bin_size,
+               y_bin_size,
+               x_gap_len_threshold,
+               y_gap_len_threshold):
+    """Finds every gap in the strips, before any are filtered out.
+
+    The first half of `mind_the_gap`, which only depends on the strips, so
+    its gaps can be reused for different numbers of intersections.
+
+    Parameters
+    ----------
+    point_coords : ndarray
+        Array of point coordinates (x,y), as from `get_coordinates`
+    x_bin_size : float
+        Width of vertical strips
+    y_bin_size : float
+        Width of horizontal strips
+    x_gap_len_threshold : float
+        Minimum length for an x_gap to be retained
+    y_gap_len_threshold : float
+        Minimum length for a y_gap to be retained
+
+    Returns
+    -------
+    x_gaps : list
+        Gaps on the x bins, as from `find_lat_gaps`
+    y_gaps : list
+        Gaps on the y bins, as from `find_lon_gaps`
+
+    """
 
     # Make sure parameters are all positive numbers
-    if min([x_bin_size, y_bin_size, x_gap_len_threshold, y_gap_len_threshold,\
-            x_min_intersections, y_min_intersections]) <= 0:
+    if min([x_bin_size, y_bin_size, x_gap_len_threshold,
+            y_gap_len_threshold]) <= 0:
         raise ValueError('All parameters must be positive')
 
-    #Load in building centroids
-    point_coords = get_coordinates(in_points)
-
     # Add columns to point coordinates of which Lon and Lat bins it goes in
     stacked, x_bins, y_bins = into_the_bins(point_coords,
                                             x_bin_size,
@@ -877,6 +1063,58 @@ def mind_the_gap(in_points,
     x_gaps = find_lat_gaps(stacked, x_bins, x_gap_len_threshold)
     y_gaps = find_lon_gaps(stacked, y_bins, y_gap_len_threshold)
 
+    return x_gaps, y_gaps
+
+def _gap_polygons(x_gaps,
+                  y_gaps,
+                  x_min_intersections,
+                  y_min_intersections,
+                  alpha=15,
+                  cluster_points=False,
+                  write_points=False):
+    """Turns gaps into polygons or points.
+
+    The second half of `mind_the_gap`, taking the gaps from `_find_gaps`.
+    The gaps passed in are left as they are.
+
+    Parameters
+    ----------
+    x_gaps : array_like
+        Gaps on the x bins, as from `find_lat_gaps`
+    y_gaps : array_like
+        Gaps on the y bins, as from `find_lon_gaps`
+    x_min_intersections : int
+        Minimum number of intersections to filter gap lines
+    y_min_intersections : int
+        Minimum number of intersections to filter gap lines
+    alpha : int
+        alpha value for finding alphashapes
+    cluster_points : boolean
+        True returns a geodataframe of MultiPoints for each gap as well as
+        polygons
+    write_points : boolean
+        If True, returns a GeoDataFrame of points that fill in the data gap
+        instead of polygons.
+
+    Returns
+    -------
+    GeoDataFrame
+        Polygons and/or points representing the data gap
+
+    """
+
+    def gen_gap_segments(x_gaps, y_gaps):
+        """Gets the endpoints of each gap, x gaps then y gaps"""
+
+        x_gap_segments = np.asarray(x_gaps)[:,[1,3,1,5]].reshape(-1, 2, 2)
+        y_gap_segments = np.asarray(y_gaps)[:,[3,1,5,1]].reshape(-1, 2, 2)
+
+        return np.concatenate([x_gap_segments, y_gap_segments])
+
+    # Make sure parameters are all positive numbers
+    if min([x_min_intersections, y_min_intersections]) <= 0:
+        raise ValueError('All parameters must be positive')
+
     # ---------Filter out gap strips without intersections--------
     x_gaps, y_gaps = intersection_filter(x_gaps,
                                          y_gaps,
@@ -898,19 +1136,19 @@ def mind_the_gap(in_points,
             return polygons, points
         return polygons
 
-    # ------------------Generate gap LineStrings------------------
-    all_gap_LineStrings, all_gap_segments, x_gap_LineStrings, \
-    y_gap_LineStrings = gen_gap_LineStrings(x_gaps, y_gaps)
-
-    # ---------------Find intersections with shapely--------------
-    intersections = find_intersections(all_gap_LineStrings)
+    # -------------------Generate gap segments-------------------
+    all_gap_segments = gen_gap_segments(x_gaps, y_gaps)
 
     # Make and return geodataframe of points if that is desired
     if write_points:
-        points_gdf = gpd.GeoDataFrame(intersections,
-                                      columns=['geometry'],
-                                      crs="EPSG:4326")
-        points_gdf.set_geometry(col='geometry', inplace=True)
+        # ------------------Find intersections------------------
+        # Only needed here, polygons find their own per cluster
+        intersections = _gap_intersections(all_gap_segments[:len(x_gaps)],
+                                           all_gap_segments[len(x_gaps):])
+
+        points_gdf = gpd.GeoDataFrame(
+            geometry=shapely.points(intersections),
+            crs="EPSG:4326")
 
         return points_gdf
 
@@ -921,15 +1159,10 @@ def mind_the_gap(in_points,
     cluster_x = []
     cluster_y = []
     for cluster in gap_clusters:
-        this_cluster_x_gaps = []
-        this_cluster_y_gaps = []
-        for gap in cluster:
-            if gap < split_ind:
-                this_cluster_x_gaps.append(gap)
-            else:
-                this_cluster_y_gaps.append(gap)
-        cluster_x.append(this_cluster_x_gaps)
-        cluster_y.append(this_cluster_y_gaps)
+        cluster = np.asarray(cluster)
+        is_x = cluster < split_ind
+        cluster_x.append(cluster[is_x])
+        cluster_y.append(cluster[~is_x])
 
     # ------------------------Make polygons-----------------------
     polygons, points = generate_alpha_polygons(cluster_x,
@@ -1,46 +1,48 @@
 """Test the Region class in auto_tune"""
 
+import pickle
+
 import geopandas as gpd
 from geopandas.testing import assert_geodataframe_equal
-from shapely.geometry import Point
 from shapely.geometry import LineString
+from shapely.geometry import box
 from shapely.testing import assert_geometries_equal
 import pytest
 
 from mind_the_gap.auto_tune import Region
 
-@pytest.fixture()
+@pytest.fixture(scope='session')
 def points():
     _points = gpd.read_file('./tests/data/test_points.gpkg')
     return _points
 
-@pytest.fixture()
+@pytest.fixture(scope='session')
 def bound():
     _bound = gpd.read_file('./tests/data/test_bound.gpkg')
     return _bound
 
-@pytest.fixture()
+@pytest.fixture(scope='session')
 def exp_grid():
     _exp_grid = gpd.read_file('./tests/data/exp_grid.gpkg')
     _exp_grid = _exp_grid.set_index('index').rename_axis(None)
     return _exp_grid
 
-@pytest.fixture()
+@pytest.fixture(scope='session')
 def exp_mind_gaps():
     _exp_mind_gaps = gpd.read_file('./tests/data/exp_mind_gaps.gpkg')
     return _exp_mind_gaps
 
-@pytest.fixture()
+@pytest.fixture(scope='session')
 def exp_auto_gaps():
     _exp_auto_gaps = gpd.read_file('./tests/data/exp_auto_gaps.gpkg')
     return _exp_auto_gaps
 
-@pytest.fixture()
+@pytest.fixture(scope='session')
 def exp_parallel_gaps():
     _exp_parallel_gaps=gpd.read_file('./tests/data/exp_parallel_gaps.gpkg')
     return _exp_parallel_gaps
 
-@pytest.fixture()
+@pytest.fixture(scope='session')
 def exp_all_points():
     _exp_all_points = gpd.read_file('./tests/data/exp_points.gpkg')
     return _exp_all_points
@@ -67,6 +69,15 @@ class TestRegion:
 
         assert_geodataframe_equal(reg.all_points_gdf, exp_all_points)
 
+    def test_pickle(self, exp_mind_gaps):
+        reg = Region(self.points, self.bound, grid_size=0.05)
+        reg = pickle.loads(pickle.dumps(reg))
+        reg.mind(0.063, 2, 3, 18)
+
+        assert_geodataframe_equal(reg.gaps, exp_mind_gaps)
+        assert reg.fit_check(0.07, 0.2, 0.8)
+        assert reg.in_gaps_ratio == pytest.approx(28 / 2455)
+
     def test_make_grid(self, exp_grid):
         reg = Region(self.points, self.bound, grid_size = 0.02)
         reg.make_grid(size = 0.02)
@@ -88,17 +99,47 @@ class TestRegion:
         fit = reg.fit_check(0.07,0.2,0.8)
 
         assert fit
+        assert reg.in_gaps_ratio == pytest.approx(28 / 2455)
 
         fit = reg.fit_check(0.07,0.7,0.8)
 
         assert fit is False
 
+    def test_fit_check_no_open_space(self):
+        # One cell covering the whole region, so there is no open space
+        reg = Region(self.points, self.bound, grid_size=5)
+        reg.mind(0.063, 2, 3, 18)
+
+        assert reg.fit_check(0.07, 0.2, 0.8) is False
+        assert reg.area_ratio == 0
+        assert reg.fit_check(0.07, -0.1, 0.8) is True
+
     def test_run(self, exp_auto_gaps):
         reg = Region(self.points, self.bound, grid_size=0.05)
         reg.run(area_ceiling=0.5)
 
         assert_geodataframe_equal(reg.gaps, exp_auto_gaps)
 
+    @pytest.mark.slow
+    def test_run_cpus(self, exp_auto_gaps):
+        reg = Region(self.points, self.bound, grid_size=0.05)
+        reg.run(area_ceiling=0.5, cpus=2)
+
+        assert_geodataframe_equal(reg.gaps, exp_auto_gaps)
+
+    def test_run_bisect(self, exp_auto_gaps):
+        reg = Region(self.points, self.bound, grid_size=0.05)
+        reg.run(area_ceiling=0.5, search='bisect')
+
+        assert_geodataframe_equal(reg.gaps, exp_auto_gaps)
+
+    def test_run_search_error(self):
+        reg = Region(self.points, self.bound, grid_size=0.05)
+
+        with pytest.raises(ValueError,
+                           match="search must be 'linear' or 'bisect'"):
+            reg.run(area_ceiling=0.5, search='bisekt')
+
     def test_parallel_run(self, exp_auto_gaps):
         reg = Region(self.points, self.bound, grid_size=0.05)
 
@@ -106,9 +147,19 @@ class TestRegion:
 
         assert_geodataframe_equal(reg.gaps, exp_auto_gaps)
 
+    @pytest.mark.slow
     def test_run_parallel(self, exp_parallel_gaps):
         reg = Region(self.points, self.bound, grid_size=0.05)
 
         reg.run_parallel(tile_size=0.8)
 
         assert_geodataframe_equal(reg.gaps, exp_parallel_gaps)
+
+    @pytest.mark.slow
+    def test_run_parallel_empty_tiles(self):
+        # Only keep buildings in the west, so the eastern tiles are empty
+        reg = Region(self.points.cx[:-0.4, :], self.bound, grid_size=0.05)
+
+        reg.run_parallel(tile_size=0.8, cpus=1)
+
+        assert reg.gaps.union_all().contains(box(0.35, -0.71, 0.78, 1.09))
@@ -1,8 +1,5 @@
 """Test the chainage module"""
 
-import sys
-import os
-
 import pytest
 import geopandas as gpd
 from geopandas.testing import assert_geoseries_equal
@@ -10,28 +7,28 @@ from geopandas.testing import assert_geodataframe_equal
 from mind_the_gap.chainage import chainage
 from mind_the_gap.chainage import prepare_points
 
-@pytest.fixture()
+@pytest.fixture(scope='session')
 def bound():
     _bound = gpd.read_file('./tests/data/slovakia_bound.gpkg')
     return _bound
 
-@pytest.fixture()
+@pytest.fixture(scope='session')
 def chain():
     _chain = gpd.read_file('./tests/data/slovakia_chain.gpkg')
     _chain = _chain['geometry']
     return _chain
 
-@pytest.fixture()
+@pytest.fixture(scope='session')
 def test_points():
     _points = gpd.read_file('./tests/data/test_points.gpkg')
     return _points
 
-@pytest.fixture
+@pytest.fixture(scope='session')
 def test_bound():
     _bound = gpd.read_file('./tests/data/test_bound.gpkg')
     return _bound
 
-@pytest.fixture
+@pytest.fixture(scope='session')
 def exp_points():
     _exp_points = gpd.read_file('./tests/data/exp_points.gpkg')
     return _exp_points
@@ -53,3 +50,13 @@ class TestChainage:
         all_points_gdf = prepare_points(test_points,test_bound,0.01)
 
         assert_geodataframe_equal(exp_points, all_points_gdf)
+
+    def test_prepare_points_offset_index(self,
+                                         test_points,
+                                         test_bound,
+                                         exp_points):
+        # The boundary is taken from the first row, whatever its label
+        offset_bound = test_bound.set_axis(test_bound.index + 5)
+        all_points_gdf = prepare_points(test_points,offset_bound,0.01)
+
+        assert_geodataframe_equal(exp_points, all_points_gdf)
@@ -1,55 +1,54 @@
 """Test for functions in Mind the Gap main module"""
 
-import csv
-
 import geopandas as gpd
 from geopandas.testing import assert_geoseries_equal
 from geopandas.testing import assert_geodataframe_equal
 import numpy as np
 from numpy.testing import assert_array_equal
 from shapely.geometry import Point
+from shapely.geometry import MultiPoint
 from shapely.geometry import LineString
 import pytest
 
 import mind_the_gap.mind_the_gap as mtg
 
-@pytest.fixture()
+@pytest.fixture(scope='session')
 def points():
     _points = gpd.read_file('./tests/data/test_points.gpkg')
     return _points
 
-@pytest.fixture()
+@pytest.fixture(scope='session')
 def expected_lat_gaps():
-    with open('./tests/data/exp_x_gaps.csv') as f:
-        _expected_lat_gaps = list(csv.reader(f,quoting=csv.QUOTE_NONNUMERIC))
+    _expected_lat_gaps = np.loadtxt('./tests/data/exp_x_gaps.csv',
+                                    delimiter=',')
     return _expected_lat_gaps
 
-@pytest.fixture()
+@pytest.fixture(scope='session')
 def expected_lon_gaps():
-    with open('./tests/data/exp_y_gaps.csv') as f:
-        _expected_lon_gaps = list(csv.reader(f, quoting=csv.QUOTE_NONNUMERIC))
+    _expected_lon_gaps = np.loadtxt('./tests/data/exp_y_gaps.csv',
+                                    delimiter=',')
     return _expected_lon_gaps
 
-@pytest.fixture()
+@pytest.fixture(scope='session')
 def exp_cluster_inters():
     cluster_inters = \
         gpd.read_file('./tests/data/exp_cluster_inters.gpkg')
     _exp_cluster_inters = cluster_inters['geometry']
     return _exp_cluster_inters
 
-@pytest.fixture()
+@pytest.fixture(scope='session')
 def exp_gaps_shapes():
     _exp_gaps_shapes = \
         gpd.read_file('./tests/data/expected_gaps_shapes.gpkg')
     return _exp_gaps_shapes
 
-@pytest.fixture()
+@pytest.fixture(scope='session')
 def exp_gaps_points():
     _exp_gaps_points = \
         gpd.read_file('./tests/data/expected_gaps_points.gpkg')
     return _exp_gaps_points
 
-@pytest.fixture()
+@pytest.fixture(scope='session')
 def exp_write_points():
     _exp_write_points = \
         gpd.read_file('./tests/data/expected_write_points.gpkg')
@@ -65,6 +64,17 @@ class TestMindTheGap:
 
         assert_array_equal(output_points, expected)
 
+    def test_get_coordinates_multipoint(self):
+        points_d = {'geometry': [Point(1,2),
+                                 MultiPoint([(2,1), (5,6)]),
+                                 Point(3,4)]}
+        points_gdf = gpd.GeoDataFrame(points_d, crs='EPSG:4326')
+
+        expected = np.array([[1,2],[2,1],[5,6],[3,4]])
+        output_points = mtg.get_coordinates(points_gdf)
+
+        assert_array_equal(output_points, expected)
+
     def test_into_the_bins(self):
         _points = np.array([[1,2],[2,1],[3,4]])
         points_in_bins, y_bins, x_bins = \
@@ -80,6 +90,15 @@ class TestMindTheGap:
         assert_array_equal(x_bins, expected_x_bins)
         assert_array_equal(points_in_bins, expected_points_in_bins)
 
+    def test_into_the_bins_ties(self):
+        # Points halfway between two bins go in the first bin
+        _points = np.array([[0,0],[0.125,0],[0.3,0],[1,0]])
+        points_in_bins, x_bins, y_bins = \
+            mtg.into_the_bins(_points, x_bin_size=0.25, y_bin_size=0.25)
+
+        assert_array_equal(x_bins, [0,0.25,0.5,0.75,1])
+        assert_array_equal(points_in_bins[:,3], [0,0,1,4])
+
     def test_find_lat_gaps(self, points, expected_lat_gaps):
         point_coords = mtg.get_coordinates(points)
         stacked, x_bins, y_bins = mtg.into_the_bins(point_coords,0.061,0.07)
@@ -98,6 +117,17 @@ class TestMindTheGap:
         assert isinstance(lon_gaps[0], list)
         assert_array_equal(lon_gaps, expected_lon_gaps)
 
+    def test_find_gaps_single_point_bin(self):
+        stacked = np.array([[0.0, 0.0, 0, 0],
+                            [0.0, 1.0, 1, 0],
+                            [1.0, 0.5, 1, 1]])
+
+        lat_gaps = mtg.find_lat_gaps(stacked, np.array([0.0, 1.0]), 0.5)
+        lon_gaps = mtg.find_lon_gaps(stacked, np.array([0.0, 1.0]), 0.5)
+
+        assert_array_equal(lat_gaps, [[0, 0, 0, 0, 1, 1, 1]])
+        assert_array_equal(lon_gaps, [[1, 1, 0, 0, 1, 1, 1]])
+
     def test_does_cross(self):
         xg1 = [0, 1, 0, 1, 0, 3, 2]
         yg1 = [0, 2, 0, 0, 0, 3, 3]
@@ -161,14 +191,32 @@ class TestMindTheGap:
 
         expected_ids = np.array([1,1,1,1,1,2,2,2,2,2,2,1,1,1,1,1,1,1,1,1,2,1, \
                                  2,2,2,2,2,2,2,2])
-        expected_gap_clusters = [[11,0,1,12,2,13,3,14,4,15,16,17,18,19,21],
-                                 [20,5,6,22,7,23,8,24,9,25,10,26,27,28,29]]
+        expected_gap_clusters = [[0,1,2,3,4,11,12,13,14,15,16,17,18,19,21],
+                                 [5,6,7,8,9,10,20,22,23,24,25,26,27,28,29]]
 
         assert_array_equal(all_gaps,np.vstack([x_gaps,y_gaps]))
         assert_array_equal(ids, expected_ids)
         assert_array_equal(gap_clusters,expected_gap_clusters)
         assert split_ind == 11
 
+    def test_find_clusters_long_chain(self):
+        # A staircase of gaps, each crossing the next, deeper than the
+        # default recursion limit
+        n = 1500
+        steps = np.arange(n, dtype=float)
+        x_gaps = np.column_stack([steps, steps, steps, steps - 1,
+                                  steps + 1, steps, np.ones(n)])
+        y_gaps = np.column_stack([steps, steps, steps, steps,
+                                  steps + 1, steps + 1, np.ones(n)])
+
+        all_gaps, ids, gap_clusters, split_ind = \
+            mtg.find_clusters(x_gaps, y_gaps)
+
+        assert len(gap_clusters) == 1
+        assert gap_clusters[0] == list(range(2 * n))
+        assert_array_equal(ids, np.ones(2 * n))
+        assert split_ind == n
+
     def test_cluster_intersections(self, points, exp_cluster_inters):
         point_coords = mtg.get_coordinates(points)
         stacked, x_bins, y_bins = mtg.into_the_bins(point_coords,0.061,0.07)
@@ -247,6 +295,18 @@ class TestMindTheGap:
                                   exp_gaps_points,
                                   check_less_precise=True)
 
+    def test_generate_alpha_polygons_no_shape(self):
+        # A single crossing has too few points for an alpha shape
+        segments = np.array([[[0,0],[0,1]],[[-1,0.5],[1,0.5]]])
+
+        shapes, points = mtg.generate_alpha_polygons([[0]],
+                                                     [[1]],
+                                                     segments,
+                                                     18)
+
+        assert len(shapes) == 0
+        assert len(points) == 1
+
     def test_mind_the_gap(self,
                           points,
                           exp_gaps_shapes,